@@ -1,8 +1,11 @@
 # Usage: python3 bestfix.py -a app name
 
 import argparse
+import asyncio
+import contextlib
 import csv
-import io
+import functools
+import hashlib
 import json
 import logging
 import linecache
@@ -22,16 +25,23 @@ from rich.console import Console
 from rich.markdown import Markdown
 from rich.panel import Panel
 from rich.progress import Progress
-from rich.syntax import Syntax
 from rich.table import Table
 from rich.terminal_theme import DEFAULT_TERMINAL_THEME, MONOKAI
 from rich.theme import Theme
 from rich.tree import Tree
-from six import moves
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 import config
-import gh as GitHubLib
-from common import extract_org_id, get_all_apps, get_scan_run, headers
+from common import (
+    extract_org_id,
+    get_all_apps,
+    get_scan_run_async,
+    headers,
+)
 
 LOG = logging.getLogger(__name__)
 for _ in ("httpx",):
@@ -62,6 +72,17 @@ else:
 
 MD_LIST_MARKER = "\n- "
 
+# Keys used for the variable info in dataflows. Older scans use lowercase keys
+PARAM_KEYS = ("Parameter", "parameter")
+LOCAL_KEYS = ("Local", "local")
+MEMBER_KEYS = ("Member", "member")
+
+# Method names that look like validation methods
+CHECK_LABELS_RE = re.compile(
+    "|".join(re.escape(label) for label in config.check_labels_list)
+)
+IS_METHOD_RE = re.compile(r"^is[_A-Z]")
+
 pdf_options = {
     "page-size": "A2",
     "margin-top": "0.5in",
@@ -73,16 +94,26 @@ pdf_options = {
 }
 
 
-def _get_code_line(source_dir, app, fname, line, variables=[]):
-    """Return the given line from the file. Handles any utf8 error from tokenize
+def _first_symbol(variable_info, keys):
+    """Return the symbol from the first variable info entry found for the given keys"""
+    for k in keys:
+        info = variable_info.get(k)
+        if info:
+            return info.get("symbol") or ""
+    return ""
+
+
+@functools.lru_cache(maxsize=None)
+def _resolve_source_path(source_dir, app_id, fname):
+    """Return the full path of the given file under the source directory.
+    Results are cached since the same files are looked up for many findings
 
+    :param app_id: App id
     :param fname: File name
-    :param line: Line number
-    :return: Exact line as string
+    :return: Full path to the file or an empty string if the file could not be located
     """
-    text = ""
     # For monorepos, app could be inside a directory
-    app_path = os.path.join(source_dir, app["id"])
+    app_path = os.path.join(source_dir, app_id)
     if os.path.exists(app_path):
         source_dir = app_path
     full_path = os.path.join(source_dir, fname)
@@ -96,31 +127,59 @@ def _get_code_line(source_dir, app, fname, line, variables=[]):
                 full_path = scala_path
             else:
                 # console.print(f"Unable to locate the file {fname} under {source_dir}")
-                return "", "", ""
+                return ""
+    return full_path
+
+
+def _get_file_lines(full_path):
+    """Return all the lines from the file. Handles any utf8 error from tokenize
+
+    :param full_path: Full path to the file
+    :return: List of lines
+    """
     try:
-        text = linecache.getline(full_path, line)
+        return linecache.getlines(full_path)
     except UnicodeDecodeError:
         console.print(
             f"Error parsing the file {full_path} in utf-8. Falling to binary mode"
         )
-        with io.open(full_path, "rb") as fp:
-            all_lines = fp.readlines()
-            if line < len(all_lines):
-                text = all_lines[line]
+        with open(full_path, "rb") as fp:
+            return fp.readlines()
+
+
+def _get_tracked_variables(variables):
+    """Return the tracked variables worth highlighting in code snippets
+
+    :param variables: Tracked variables
+    :return: List of variables with the last tracked variable first
+    """
+    return [
+        var
+        for var in variables[::-1]
+        if "$" not in var and var not in ("this", "self", "req", "res", "p1")
+    ]
+
+
+def _get_code_line(text, variables=[]):
+    """Return the given line with any tracked variable spaced out
+
+    :param text: Line of code
+    :param variables: Variables from _get_tracked_variables
+    :return: Line as string and the detected variable
+    """
     variable_detected = ""
-    for var in variables[::-1]:
+    for var in variables:
         if var in text:
-            if "$" not in var and var not in ("this", "self", "req", "res", "p1"):
-                variable_detected = var
-                text = (
-                    text.replace(f"({var}", f"( {var} ")
-                    .replace(f"{var})", f" {var} )")
-                    .replace(f",{var}", f", {var} ")
-                    .replace(f"{var},", f" {var} ,")
-                    .replace(f"+{var}", f"+ {var} ")
-                )
-                break
-    return text, variable_detected, full_path
+            variable_detected = var
+            text = (
+                text.replace(f"({var}", f"( {var} ")
+                .replace(f"{var})", f" {var} )")
+                .replace(f",{var}", f", {var} ")
+                .replace(f"{var},", f" {var} ,")
+                .replace(f"+{var}", f"+ {var} ")
+            )
+            break
+    return text, variable_detected
 
 
 def get_code(source_dir, app, fname, lineno, variables, max_lines=3, tabbed=False):
@@ -132,24 +191,27 @@ def get_code(source_dir, app, fname, lineno, variables, max_lines=3, tabbed=Fals
     """
     if not fname:
         return "", "", ""
+    full_path = _resolve_source_path(source_dir, app["id"], fname)
+    if not full_path:
+        return "", "", ""
     lines = []
     max_lines = max(max_lines, 1)
     lmin = max(1, lineno - max_lines // 2)
     lmax = lmin + max_lines
     variable_detected = ""
     tmplt = "%i\t%s" if tabbed else "%i %s"
-    full_path = ""
-    for line in moves.xrange(lmin, lmax):
-        text, new_variable_detected, full_path = _get_code_line(
-            source_dir, app, fname, line, variables
-        )
-        if not variable_detected and new_variable_detected:
-            variable_detected = new_variable_detected
+    variables = _get_tracked_variables(variables)
+    # Read the file once and index into it for every line of context
+    all_lines = _get_file_lines(full_path)
+    for line in range(lmin, lmax):
+        if line > len(all_lines):
+            break
+        text = all_lines[line - 1]
         if isinstance(text, bytes):
             text = text.decode("utf-8", "ignore")
-
-        if not len(text):
-            break
+        text, new_variable_detected = _get_code_line(text, variables)
+        if not variable_detected and new_variable_detected:
+            variable_detected = new_variable_detected
         lines.append(tmplt % (line, text))
     if lines:
         return "".join(lines), variable_detected, full_path
@@ -174,12 +236,27 @@ def find_ignorables(app_language, last_location_fname, files_loc_list):
     return list(ignorables_list)
 
 
+# Suggestions for categories that do not depend on the dataflow
+CATEGORY_SUGGESTION_TEMPLATES = {
+    "NoSQL Injection": """Use any alternative SDK method with builtin parameterization capability. Parameterize and validate the variables `{variable_detected}` before invoking the NoSQL method `{sink_method}`.""",
+    "Directory Traversal": """Use an allowlist of safe file or URL locations and compare `{variable_detected}` against this list before invoking the method `{sink_method}`.""",
+    "XML External Entities": """Follow security best practices to configure and use the XML library in a safe manner.""",
+    "LDAP Injection": """Ensure the variable `{variable_detected}` are encoded or sanitized before invoking the LDAP method `{sink_method}`.""",
+    "Mail Injection": """Ensure the variable `{variable_detected}` are encoded or sanitized before invoking the Email service.""",
+    "Deprecated Function Use": "Ensure the sink method `{sink_method}` is appropriate for use in this context.",
+}
+
+
 def get_category_suggestion(
     category, variable_detected, source_method, sink_method, ptags_set, mtags_set
 ):
     suppressable_finding = False
     category_suggestion = ""
-    if category in ("Remote Code Execution", "Potential Remote Code Execution"):
+    if category in CATEGORY_SUGGESTION_TEMPLATES:
+        category_suggestion = CATEGORY_SUGGESTION_TEMPLATES[category].format(
+            variable_detected=variable_detected, sink_method=sink_method
+        )
+    elif category in ("Remote Code Execution", "Potential Remote Code Execution"):
         if variable_detected:
             category_suggestion = f"""Use an allowlist for approved commands and compare the variables `{variable_detected}` against this list in a new validation method. Then, specify this validation method name in the remediation config file."""
         else:
@@ -190,10 +267,6 @@ def get_category_suggestion(
             category_suggestion = f"""Use any alternative SQL method with builtin parameterization capability instead of string manipulation methods. Parameterize and validate the variables `{variable_detected}` before invoking the SQL method `{sink_method}`."""
         else:
             category_suggestion = f"""Use any alternative SQL method with builtin parameterization capability. Parameterize and validate the variables `{variable_detected}` before invoking the SQL method `{sink_method}`."""
-    elif category == "NoSQL Injection":
-        category_suggestion = f"""Use any alternative SDK method with builtin parameterization capability. Parameterize and validate the variables `{variable_detected}` before invoking the NoSQL method `{sink_method}`."""
-    elif category == "Directory Traversal":
-        category_suggestion = f"""Use an allowlist of safe file or URL locations and compare `{variable_detected}` against this list before invoking the method `{sink_method}`."""
     elif category in ("Deserialization", "Deserialization of HTTP data"):
         if sink_method in ("json.loads"):
             category_suggestion = f"""This is an informational finding since the sink method `{sink_method}` is safe by default."""
@@ -219,8 +292,6 @@ def get_category_suggestion(
             suppressable_finding = True
         else:
             category_suggestion = f"""Validate and ensure `{variable_detected}` does not contain URLs and other malicious input. For externally injected values, compare `{variable_detected}` against an allowlist of approved URL domains or service IP addresses. Then, specify this validation method name or the source method `{source_method}` in the remediation config file to suppress this finding."""
-    elif category == "XML External Entities":
-        category_suggestion = """Follow security best practices to configure and use the XML library in a safe manner."""
     elif category in ("Cross-Site Scripting", "XSS"):
         if source_method == "^__node^.process.%env":
             category_suggestion = """This is an informational finding since reading an environment variable using `process.env` is safe by default."""
@@ -229,8 +300,6 @@ def get_category_suggestion(
             category_suggestion = f"""Ensure the variable `{variable_detected}` are encoded or sanitized before returning via HTML or API response."""
         else:
             category_suggestion = """Ensure all user input variables are encoded or sanitized before returning via HTML or API response."""
-    elif category == "LDAP Injection":
-        category_suggestion = f"""Ensure the variable `{variable_detected}` are encoded or sanitized before invoking the LDAP method `{sink_method}`."""
     elif category in ("Hardcoded Credentials", "Weak Hash"):
         if '"' in variable_detected:
             category_suggestion = f"""Ensure `{variable_detected}` is the correct value in this context before invoking the sink method `{sink_method}`."""
@@ -259,10 +328,6 @@ def get_category_suggestion(
             suppressable_finding = True
         else:
             category_suggestion = f"""This finding is relevant only if the variable `{variable_detected}` holds security-sensitive value. Ignore this finding otherwise."""
-    elif category == "Mail Injection":
-        category_suggestion = f"""Ensure the variable `{variable_detected}` are encoded or sanitized before invoking the Email service."""
-    elif category == "Deprecated Function Use":
-        category_suggestion = f"Ensure the sink method `{sink_method}` is appropriate for use in this context."
     elif category in (
         "Security Best Practices",
         "Race Condition",
@@ -469,11 +534,10 @@ def get_best_oss_fix(package_cves, reachable_oss_count):
     return rows
 
 def get_ideas(
-    client, org_id, app_name, scan, findings, source_dir, annotated_findings, app_language
+    run_info, org_id, app_name, scan, findings, source_dir, annotated_findings, app_language
 ):
     ideas = []
     perf_based_reco = False
-    run_info = get_scan_run(client, org_id, scan, app_name)
     summary = run_info.get("summary", {})
 
     environment = summary.get("environment", {})
@@ -1078,7 +1142,7 @@ def print_scan_stats(scan, counts):
             table.add_row(col, num_to_emoji(stats_counts["ratings_counts_dict"][col]))
         console.print(table)
 
-def process_findings(app, app_language, scan, findings):
+def process_findings(app, app_language, scan, findings, render_table=True):
     source_cohorts = defaultdict(dict)
     sink_cohorts = defaultdict(dict)
     source_sink_cohorts = defaultdict(dict)
@@ -1092,21 +1156,28 @@ def process_findings(app, app_language, scan, findings):
         # Skip ignored and fixed findings
         if afinding.get("status") in ("ignore", "ignored", "fixed"):
             continue
+        afinding_id = afinding.get("id")
         category = afinding.get("category")
+        finding_type = afinding.get("type")
+        internal_id = afinding.get("internal_id")
         # Ignore Sensitive Data Leaks, Sensitive Data Usage and Log Forging for now.
         if "Sensitive" in category or "Log" in category:
             continue
         files_loc_list = []
         files_method_list = []
-        files_method_simple_list = []
+        # Sets for fast membership checks when deduplicating the above lists
+        seen_loc = set()
+        seen_method_simple = set()
         tracked_list = []
+        # Companion set for fast membership checks on tracked_list
+        tracked_set = set()
         snippet_list = []
         source_method = ""
         sink_method = ""
         cvss_31_severity_rating = ""
         cvss_score = ""
         reachability = ""
-        details = afinding.get("details", {})
+        details = afinding.get("details") or {}
         source_method = details.get("source_method", "")
         sink_method = details.get("sink_method", "")
         # Simplify method names
@@ -1152,6 +1223,7 @@ def process_findings(app, app_language, scan, findings):
         for df in dataflows:
             location = df.get("location", {})
             file_name = location.get("file_name")
+            line_number = location.get("line_number")
             method_name = location.get("method_name")
             # Simplify method names
             if method_name:
@@ -1177,10 +1249,11 @@ def process_findings(app, app_language, scan, findings):
                     if all_et in ptags:
                         event_routes.add("*")
                         break
-            if file_name == "N/A" or not location.get("line_number"):
+            if file_name == "N/A" or not line_number:
                 continue
+            is_cs = ".cs" in file_name
             # Skip getter/setter methods in csharp
-            if ".cs" in file_name and (
+            if is_cs and (
                 "get_" in short_method_name or "set_" in short_method_name
             ):
                 continue
@@ -1222,19 +1295,9 @@ def process_findings(app, app_language, scan, findings):
             ):
                 http_routes.add("*")
             if variableInfo:
-                parameter = variableInfo.get("Parameter")
-                if not parameter:
-                    parameter = variableInfo.get("parameter")
-                local = variableInfo.get("Local")
-                member = variableInfo.get("Member")
-                if not member:
-                    member = variableInfo.get("member")
-                if not local:
-                    local = variableInfo.get("local")
-                if parameter and parameter.get("symbol"):
-                    symbol = parameter.get("symbol")
-                if member and member.get("symbol"):
-                    msymbol = member.get("symbol")
+                symbol = _first_symbol(variableInfo, PARAM_KEYS)
+                msymbol = _first_symbol(variableInfo, MEMBER_KEYS)
+                if msymbol:
                     if (
                         "(" in msymbol
                         or ")" in msymbol
@@ -1245,11 +1308,12 @@ def process_findings(app, app_language, scan, findings):
                             snippet_list.append(msymbol)
                     else:
                         symbol = msymbol.split(".")[-1]
-                if local and local.get("symbol"):
-                    symbol = local.get("symbol")
+                lsymbol = _first_symbol(variableInfo, LOCAL_KEYS)
+                if lsymbol:
+                    symbol = lsymbol
                 if (
                     symbol
-                    and symbol not in tracked_list
+                    and symbol not in tracked_set
                     and "____obj" not in symbol
                     and "_tmp_" not in symbol
                     and not symbol.endswith("_0")
@@ -1260,15 +1324,17 @@ def process_findings(app, app_language, scan, findings):
                     if "(" in symbol or ")" in symbol or "{" in symbol or " " in symbol:
                         if symbol not in snippet_list:
                             snippet_list.append(symbol)
-                    elif ".cs" in location.get("file_name"):
-                        if "Dto" not in symbol and symbol not in tracked_list:
+                    elif is_cs:
+                        if "Dto" not in symbol and symbol not in tracked_set:
+                            tracked_set.add(symbol)
                             tracked_list.append(symbol)
                     else:
                         cleaned_symbol = symbol.replace("val$", "")
                         # Clean $ suffixed variables in scala
                         if file_name.endswith(".scala") and "$" in cleaned_symbol:
                             cleaned_symbol = cleaned_symbol.split("$")[0]
-                        if cleaned_symbol not in tracked_list:
+                        if cleaned_symbol not in tracked_set:
+                            tracked_set.add(cleaned_symbol)
                             tracked_list.append(cleaned_symbol)
             if short_method_name and "empty" not in short_method_name:
                 if "$" in short_method_name and app_language in ("java", "javasrc"):
@@ -1289,42 +1355,40 @@ def process_findings(app, app_language, scan, findings):
                     )
                 methods_list.append(short_method_name)
                 fmt_short_method_name = short_method_name
-                for check_labels in config.check_labels_list:
-                    if check_labels in short_method_name.lower():
-                        check_methods.add(method_name)
-                        fmt_short_method_name = (
-                            f"[dim green]{short_method_name}[/dim green]"
-                        )
+                if CHECK_LABELS_RE.search(short_method_name.lower()):
+                    check_methods.add(method_name)
+                    fmt_short_method_name = (
+                        f"[dim green]{short_method_name}[/dim green]"
+                    )
                 # Methods that start with is are usually validation methods
-                if re.match(r"^is[_A-Z]", short_method_name):
+                if IS_METHOD_RE.match(short_method_name):
                     check_methods.add(method_name)
             if not source_method:
-                source_method = (
-                    f'{location.get("file_name")}:{location.get("line_number")}'
-                )
-            loc_line = f'{location.get("file_name")}:{location.get("line_number")}'
+                source_method = f"{file_name}:{line_number}"
+            loc_line = f"{file_name}:{line_number}"
             last_tracked = ""
             if tracked_list:
                 last_tracked = tracked_list[-1]
-            method_line = f'[dim]{location.get("file_name")}:{location.get("line_number")}[/dim]  {fmt_short_method_name}( [bold red]{last_tracked}[/bold red] )'
-            method_simple_line = f'[dim]{location.get("file_name")}  {short_method_name}( [bold red]{last_tracked}[/bold red] )'
+            method_line = f"[dim]{file_name}:{line_number}[/dim]  {fmt_short_method_name}( [bold red]{last_tracked}[/bold red] )"
+            method_simple_line = f"[dim]{file_name}  {short_method_name}( [bold red]{last_tracked}[/bold red] )"
             # Remove erroneous CI prefixes
             for tci in config.trimmable_ci_paths:
                 loc_line = loc_line.replace(tci, "")
                 method_line = method_line.replace(tci, "")
             loc_line = unquote(loc_line)
             method_line = unquote(method_line)
-            if loc_line not in files_loc_list:
+            if loc_line not in seen_loc:
+                seen_loc.add(loc_line)
                 files_loc_list.append(loc_line)
-            if method_simple_line not in files_method_simple_list:
+            if method_simple_line not in seen_method_simple:
+                seen_method_simple.add(method_simple_line)
                 files_method_list.append(method_line)
-                files_method_simple_list.append(method_simple_line)
         if dataflows and dataflows[-1]:
             sink = dataflows[-1].get("location", {})
             if sink and not sink_method:
                 sink_method = f'{sink.get("file_name")}:{sink.get("line_number")}'
         ###########
-        if afinding.get("type") == "vuln":
+        if finding_type == "vuln":
             methods_list = methods_list
             check_methods = list(check_methods)
             last_location = ""
@@ -1335,27 +1399,19 @@ def process_findings(app, app_language, scan, findings):
             # Ignore html files
             if "html" in last_location and len(files_loc_list) > 2:
                 last_location = files_loc_list[-2]
-            if first_location and not source_cohorts[category].get(first_location):
-                source_cohorts[category][first_location] = []
-            if last_location and not sink_cohorts[category].get(last_location):
-                sink_cohorts[category][last_location] = []
-            if (
-                first_location
-                and last_location
-                and not source_sink_cohorts[category].get(
-                    f"{first_location}|{last_location}"
-                )
-            ):
-                source_sink_cohorts[category][f"{first_location}|{last_location}"] = []
             # Identify cohorts
             if first_location:
-                source_cohorts[category][first_location].append(afinding.get("id"))
+                source_cohorts[category].setdefault(first_location, []).append(
+                    afinding_id
+                )
             if last_location:
-                sink_cohorts[category][last_location].append(afinding.get("id"))
+                sink_cohorts[category].setdefault(last_location, []).append(
+                    afinding_id
+                )
             if first_location and last_location:
-                source_sink_cohorts[category][
-                    f"{first_location}|{last_location}"
-                ].append(afinding.get("id"))
+                source_sink_cohorts[category].setdefault(
+                    f"{first_location}|{last_location}", []
+                ).append(afinding_id)
             tmpA = last_location.split(":")
             tmpB = first_location.split(":")
             last_location_lineno = 1
@@ -1538,74 +1594,64 @@ Specify the sink method in your remediation config to suppress this finding.\n
 {ignorables_suggestion}
 """
                 )
-            deep_link = f"""https://app.shiftleft.io/apps/{app["id"]}/vulnerabilities?scan={scan.get("id")}&expanded=true&findingId={afinding.get("id")}"""
-            comment_str = "//"
-            if app_language == "python":
-                comment_str = "#"
-            data_found = True
-            fmt_code_snippet = code_snippet
-            if not CI_MODE and code_snippet:
-                fmt_code_snippet = Syntax(
-                    f"{comment_str} {last_location_fname}\n\n" + code_snippet,
-                    app_language,
-                )
-            file_locations_md = ""
-            if CI_MODE:
-                file_locations_md = Markdown(
-                    MD_LIST_MARKER
-                    + MD_LIST_MARKER.join(
-                        [
-                            f"[{fl}]({to_local_path(full_path_prefix, fl)})"
-                            for fl in files_loc_list
-                        ]
-                    )
-                )
-            # elif "win32" in sys.platform and not CI_MODE:
-            #     file_locations_md = "\n\n".join(
-            #         [f"{to_local_path(full_path_prefix, fl)}" for fl in files_loc_list]
-            #     )
-            else:
-                file_locations_md = file_locations_tree(
-                    afinding.get("internal_id"),
-                    afinding.get("category"),
-                    files_loc_list,
-                    files_method_list,
-                    http_routes,
-                    tracked_list,
-                    full_path_prefix,
-                )
-
+            deep_link = f"""https://app.shiftleft.io/apps/{app["id"]}/vulnerabilities?scan={scan.get("id")}&expanded=true&findingId={afinding_id}"""
             file_locations = {
-                "internal_id" : afinding.get("internal_id"),
-                "category": afinding.get("category"),
+                "internal_id" : internal_id,
+                "category": category,
                 "files_loc_list": files_loc_list,
                 "files_method_list": files_method_list,
                 "http_routes": http_routes,
                 "tracked_list": tracked_list,
                 "full_path_prefix": full_path_prefix,
             }
-            
-            afinding_id = afinding.get("id")
 
-            table_rows[afinding_id] = (
-                {
-                    "link": f"""[link={deep_link}]{afinding.get("id")}[/link]""",
-                    "cvss_31_severity_rating": cvss_31_severity_rating,
-                    "category": category,
-                    "file_locations_md": file_locations_md,
-                    "best_fix_markdown": Markdown(best_fix),
-                }
-            )
+            # Rich renderables are only needed when the Best Fix table is printed
+            if render_table:
+                file_locations_md = ""
+                if CI_MODE:
+                    file_locations_md = Markdown(
+                        MD_LIST_MARKER
+                        + MD_LIST_MARKER.join(
+                            [
+                                f"[{fl}]({to_local_path(full_path_prefix, fl)})"
+                                for fl in files_loc_list
+                            ]
+                        )
+                    )
+                # elif "win32" in sys.platform and not CI_MODE:
+                #     file_locations_md = "\n\n".join(
+                #         [f"{to_local_path(full_path_prefix, fl)}" for fl in files_loc_list]
+                #     )
+                else:
+                    file_locations_md = file_locations_tree(
+                        internal_id,
+                        category,
+                        files_loc_list,
+                        files_method_list,
+                        http_routes,
+                        tracked_list,
+                        full_path_prefix,
+                    )
+
+                table_rows[afinding_id] = (
+                    {
+                        "link": f"""[link={deep_link}]{afinding_id}[/link]""",
+                        "cvss_31_severity_rating": cvss_31_severity_rating,
+                        "category": category,
+                        "file_locations_md": file_locations_md,
+                        "best_fix_markdown": Markdown(best_fix),
+                    }
+                )
 
             annotated_findings.append(
                 {
-                    "id": afinding.get("id"),
+                    "id": afinding_id,
                     "deep_link": deep_link,
                     "category": category,
                     "title": afinding.get("title"),
                     "version_first_seen": afinding.get("version_first_seen"),
                     "scan_first_seen": afinding.get("scan_first_seen"),
-                    "internal_id": afinding.get("internal_id"),
+                    "internal_id": internal_id,
                     "cvss_31_severity_rating": cvss_31_severity_rating,
                     "cvss_score": cvss_score,
                     "reachability": reachability,
@@ -1625,11 +1671,11 @@ Specify the sink method in your remediation config to suppress this finding.\n
             )
         ###########
         ###########
-        if afinding.get("type") == "oss_vuln":
+        if finding_type == "oss_vuln":
             fix = details.get("fix", "")
             package_cves[package_url].append(
                 {
-                    "id": afinding.get("id"),
+                    "id": afinding_id,
                     "cve": cve,
                     "oss_internal_id": oss_internal_id,
                     "fix": fix,
@@ -1645,10 +1691,8 @@ Specify the sink method in your remediation config to suppress this finding.\n
 
     return source_cohorts, sink_cohorts, source_sink_cohorts, package_cves, reachable_oss_count, unreachable_oss_count, annotated_findings, table_rows
 
-def find_best_fix(org_id, app, scan, findings, counts, source_dir, source_cohorts, sink_cohorts, source_sink_cohorts, package_cves, reachable_oss_count, unreachable_oss_count, annotated_findings, table_rows):
-    if not findings:
-        return annotated_findings
-    data_found = False
+def get_best_fix_table(app, findings, table_rows):
+    """Build the Best Fix table from the table rows collected by process_findings"""
     table = Table(
         title=f"""Best Fix Suggestions for {app["name"]}""",
         show_lines=True,
@@ -1669,28 +1713,31 @@ def find_best_fix(org_id, app, scan, findings, counts, source_dir, source_cohort
     table.add_column("Comment", overflow="fold")
 
     for afinding in findings:
-            afinding_id = afinding.get("id")
+        afinding_id = afinding.get("id")
+        if afinding_id in table_rows:
+            if CI_MODE:
+                table.add_row(
+                    table_rows[afinding_id]["link"],
+                    table_rows[afinding_id]["cvss_31_severity_rating"],
+                    table_rows[afinding_id]["category"],
+                    table_rows[afinding_id]["file_locations_md"],
+                    table_rows[afinding_id]["best_fix_markdown"],
+                )
+            else:
+                table.add_row(
+                    table_rows[afinding_id]["link"],
+                    f"""{'[bold red]' if table_rows[afinding_id]["cvss_31_severity_rating"] == 'critical' else '[yellow]'}{table_rows[afinding_id]["cvss_31_severity_rating"]}""",
+                    table_rows[afinding_id]["file_locations_md"],
+                    table_rows[afinding_id]["best_fix_markdown"],
+                )
 
-            if afinding_id in table_rows:
-                if data_found == False:
-                    data_found = True
+    return table
 
-                if CI_MODE:
-                    table.add_row(
-                        table_rows[afinding_id]["link"],
-                        table_rows[afinding_id]["cvss_31_severity_rating"],
-                        table_rows[afinding_id]["category"],
-                        table_rows[afinding_id]["file_locations_md"],
-                        table_rows[afinding_id]["best_fix_markdown"],
-                    )
-                else:
-                    table.add_row(
-                        table_rows[afinding_id]["link"],
-                        f"""{'[bold red]' if table_rows[afinding_id]["cvss_31_severity_rating"] == 'critical' else '[yellow]'}{table_rows[afinding_id]["cvss_31_severity_rating"]}""",
-                        table_rows[afinding_id]["file_locations_md"],
-                        table_rows[afinding_id]["best_fix_markdown"],
-                    )
 
+def find_best_fix(org_id, app, scan, findings, counts, source_dir, source_cohorts, sink_cohorts, source_sink_cohorts, package_cves, reachable_oss_count, unreachable_oss_count, annotated_findings, table_rows, render_table=True):
+    if not findings:
+        return annotated_findings
+    data_found = bool(annotated_findings)
     # Executive summary section
     if scan:
         print_scan_stats(scan, counts)
@@ -1705,12 +1752,17 @@ def find_best_fix(org_id, app, scan, findings, counts, source_dir, source_cohort
         unreachable_oss_count,
     )
     if data_found:
-        # Print Bestfix table
-        console.print("\n\n")
-        console.print(table)
-        cohort_analysis(
-            app["id"], scan.get("id"), source_cohorts, sink_cohorts, source_sink_cohorts
-        )
+        if render_table:
+            # Print Bestfix table
+            console.print("\n\n")
+            console.print(get_best_fix_table(app, findings, table_rows))
+            cohort_analysis(
+                app["id"],
+                scan.get("id"),
+                source_cohorts,
+                sink_cohorts,
+                source_sink_cohorts,
+            )
     else:
         console.print("\n")
         console.print(
@@ -1722,22 +1774,28 @@ def find_best_fix(org_id, app, scan, findings, counts, source_dir, source_cohort
         )
     # Annotate the pull request
     if os.getenv("GITHUB_TOKEN"):
+        # PyGitHub is slow to import and only needed for annotations
+        import gh as GitHubLib
+
         GitHubLib.annotate(annotated_findings, scan, False)
     return annotated_findings
 
 
-def export_csv(annotated_findings, report_file):
+def export_csv(csvfile, writer, annotated_findings):
+    """Write the annotated findings to the open csv file.
+    The header is written along with the first batch of findings
+
+    :param csvfile: Report file opened for writing
+    :param writer: DictWriter returned by a previous call or None
+    :return: DictWriter to reuse for the next batch of findings
+    """
     if annotated_findings:
-        fieldnames = annotated_findings[0].keys()
-        if not os.path.exists(report_file):
-            with open(report_file, "w", newline="") as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-        with open(report_file, "a", newline="") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            for finding in annotated_findings:
-                writer.writerow(finding)
-            console.print(f"CSV exported to {report_file}")
+        if not writer:
+            writer = csv.DictWriter(csvfile, fieldnames=annotated_findings[0].keys())
+            writer.writeheader()
+        writer.writerows(annotated_findings)
+        console.print(f"CSV exported to {csvfile.name}")
+    return writer
 
 def export_json(app, scan, annotated_findings, oss_findings, counts, report_file, ideas, perf_based_reco):
     message = ""
@@ -1781,57 +1839,176 @@ def export_json(app, scan, annotated_findings, oss_findings, counts, report_file
     
     console.print(f"JSON exported to {report_file}")
 
-def get_all_findings_with_scan(client, org_id, app_name, version, ratings):
-    """Method to retrieve all findings"""
-    findings_list = []
+async def _get_findings_page(client, app_name, findings_url):
+    """Retrieve and parse a single page of findings
+
+    :return: Parsed json response or None if the page could not be retrieved
+    """
+    r = None
+    for attempt in range(config.max_retries):
+        try:
+            r = await client.get(findings_url, headers=headers, timeout=config.timeout)
+            break
+        except httpx.ReadTimeout:
+            # Back off exponentially before retrying the same page
+            if attempt < config.max_retries - 1:
+                await asyncio.sleep(2**attempt)
+        except Exception:
+            break
+    else:
+        console.print(
+            f"Unable to retrieve findings for {app_name} due to timeout after {config.max_retries} attempts of {config.timeout} seconds"
+        )
+        return None
+    if r is None:
+        console.print(f"Unable to retrieve findings for {app_name}")
+        return None
+    if r.status_code != 200:
+        console.print(
+            f"Unable to retrieve findings for {app_name} due to http error {r.status_code}"
+        )
+        return None
+    # Findings pages can be several MB, so prefer the faster parser
+    return orjson.loads(r.content) if orjson else r.json()
+
+
+def _get_remaining_page_urls(next_page, total_count):
+    """Return the urls of all the remaining pages starting from next_page.
+    Returns an empty list if the pages cannot be derived from the url
+
+    :param next_page: next_page url returned by the api
+    :param total_count: Total number of findings returned by the api
+    """
+    parsed = urllib.parse.urlparse(next_page)._replace(
+        netloc=config.SHIFTLEFT_API_HOST
+    )
+    query = urllib.parse.parse_qs(parsed.query)
+    try:
+        page = int(query["page"][0])
+        per_page = int(query["per_page"][0])
+    except (KeyError, ValueError):
+        return []
+    if not total_count or per_page < 1:
+        return []
+    last_page = math.ceil(total_count / per_page)
+    return [
+        parsed._replace(
+            query=re.sub(r"(?<![^&])page=\d+", f"page={p}", parsed.query)
+        ).geturl()
+        for p in range(page, last_page + 1)
+    ]
+
+
+def _get_findings_url(org_id, app_name, version, ratings):
     version_suffix = f"&version={version}" if version else ""
     findings_url = f"https://{config.SHIFTLEFT_API_HOST}/api/v4/orgs/{org_id}/apps/{app_name}/findings?per_page=249&type=oss_vuln&type=vuln&include_dataflows=true{version_suffix}"
     for rating in ratings:
         findings_url = f"{findings_url}&finding_tags=cvss_31_severity_rating={rating}"
-    page_available = True
+    return findings_url
+
+
+async def get_all_findings_with_scan(client, org_id, app_name, version, ratings):
+    """Method to retrieve all findings"""
+    findings_list = []
+    findings_url = _get_findings_url(org_id, app_name, version, ratings)
     scan = {}
     counts = []
-    while page_available:
-        try:
-            r = client.get(findings_url, headers=headers, timeout=config.timeout)
-        except httpx.ReadTimeout:
-            console.print(
-                f"Unable to retrieve findings for {app_name} due to timeout after {config.timeout} seconds"
+    semaphore = asyncio.Semaphore(config.page_concurrency)
+
+    async def get_page(url):
+        async with semaphore:
+            return await _get_findings_page(client, app_name, url)
+
+    while findings_url:
+        raw_response = await get_page(findings_url)
+        findings_url = None
+        if not raw_response or not raw_response.get("response"):
+            break
+        response = raw_response.get("response")
+        scan = response.get("scan")
+        counts = response.get("counts")
+        if not scan:
+            break
+        findings = response.get("findings")
+        if not findings:
+            break
+        findings_list += findings
+        next_page = raw_response.get("next_page")
+        page_urls = []
+        if next_page:
+            page_urls = _get_remaining_page_urls(
+                next_page, response.get("total_count")
             )
-            continue
-        except Exception:
-            console.print(f"Unable to retrieve findings for {app_name}")
-            continue
-        if r.status_code == 200:
-            raw_response = r.json()
-            if raw_response and raw_response.get("response"):
-                response = raw_response.get("response")
-                scan = response.get("scan")
-                counts = response.get("counts")
-                if not scan:
-                    page_available = False
-                    continue
-                findings = response.get("findings")
-                if not findings:
-                    page_available = False
-                    continue
-                findings_list += findings
-                if raw_response.get("next_page"):
-                    parsed = urllib.parse.urlparse(raw_response.get("next_page"))
-                    findings_url = parsed._replace(
-                        netloc=config.SHIFTLEFT_API_HOST
-                    ).geturl()
+        if page_urls:
+            # total_count is known, so fetch the remaining pages concurrently
+            page_responses = await asyncio.gather(*(get_page(u) for u in page_urls))
+            for page_url, page_response in zip(page_urls, page_responses):
+                if page_response and page_response.get("response"):
+                    findings_list += (
+                        page_response.get("response").get("findings") or []
+                    )
                 else:
-                    page_available = False
-        else:
-            page_available = False
-            console.print(
-                f"Unable to retrieve findings for {app_name} due to http error {r.status_code}"
+                    console.print(
+                        f"Findings from {page_url} are missing for {app_name} as the page could not be retrieved"
+                    )
+            # Follow any further pages sequentially
+            next_page = (
+                page_responses[-1].get("next_page") if page_responses[-1] else None
             )
+        if next_page:
+            parsed = urllib.parse.urlparse(next_page)
+            findings_url = parsed._replace(netloc=config.SHIFTLEFT_API_HOST).geturl()
     return scan, findings_list, counts
 
 
-def export_report(
+async def _get_latest_scan_id(client, app_name, findings_url):
+    """Return the id of the latest scan using a counts only query"""
+    counts_url = findings_url.replace(
+        "include_dataflows=true", "include_dataflows=false&only_counts=true"
+    )
+    raw_response = await _get_findings_page(client, app_name, counts_url)
+    if raw_response and raw_response.get("response"):
+        scan = raw_response.get("response").get("scan")
+        if scan:
+            return scan.get("id")
+    return None
+
+
+async def get_all_findings_cached(client, org_id, app_name, version, ratings):
+    """Same as get_all_findings_with_scan but reuses the findings cached on disk
+    by a previous run as long as there is no newer scan for the app
+    """
+    findings_url = _get_findings_url(org_id, app_name, version, ratings)
+    url_hash = hashlib.sha256(findings_url.encode("utf-8")).hexdigest()[:16]
+    cache_file = os.path.join(config.cache_dir, org_id, f"{app_name}-{url_hash}.json")
+    scan_id = await _get_latest_scan_id(client, app_name, findings_url)
+    if scan_id and os.path.exists(cache_file):
+        try:
+            with open(cache_file, "r") as fp:
+                cached = json.load(fp)
+            if cached.get("scan_id") == scan_id:
+                return cached.get("scan"), cached.get("findings"), cached.get("counts")
+        except (OSError, ValueError):
+            pass
+    scan, findings, counts = await get_all_findings_with_scan(
+        client, org_id, app_name, version, ratings
+    )
+    if scan and findings and scan.get("id") == scan_id:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(cache_file, "w") as fp:
+            json.dump(
+                {
+                    "scan_id": scan_id,
+                    "scan": scan,
+                    "findings": findings,
+                    "counts": counts,
+                },
+                fp,
+            )
+    return scan, findings, counts
+
+
+async def export_report(
     org_id,
     app_list,
     report_file,
@@ -1840,6 +2017,7 @@ def export_report(
     version=None,
     ratings=["critical", "high"],
     troubleshoot=False,
+    use_cache=False,
 ):
     if not app_list:
         app_list = get_all_apps(org_id)
@@ -1857,26 +2035,56 @@ def export_report(
             start=True,
         )
         limits = httpx.Limits(
-            max_keepalive_connections=20, max_connections=100, keepalive_expiry=120
+            max_keepalive_connections=100, max_connections=1000, keepalive_expiry=120
         )
-        with httpx.Client(http2="win32" not in sys.platform, limits=limits) as client:
-            for app in app_list:
+        # Connection failures are retried by the transport
+        transport = httpx.AsyncHTTPTransport(http2=True, limits=limits, retries=2)
+        # Bound the number of apps whose findings are fetched at the same time
+        semaphore = asyncio.Semaphore(config.app_concurrency)
+        # html and svg reports are saved from the console, so they always need the tables.
+        # Skip building them for csv and json exports that are not watched on a terminal
+        render_table = rformat in ("html", "svg") or sys.stdout.isatty()
+        get_findings = (
+            get_all_findings_cached if use_cache else get_all_findings_with_scan
+        )
+        # Reports are appended to by every app
+        report_lock = asyncio.Lock()
+        csv_writer = None
+        async with contextlib.AsyncExitStack() as stack:
+            client = await stack.enter_async_context(
+                httpx.AsyncClient(transport=transport)
+            )
+            # The csv report is opened once and shared by all the apps
+            csvfile = None
+            if rformat == "csv":
+                csvfile = stack.enter_context(open(report_file, "w", newline=""))
+
+            async def process_app(app):
+                nonlocal csv_writer
                 app_id = app.get("id")
                 app_name = app.get("name")
                 if app_name in ("Benchmark"):
-                    continue
-                progress.update(task, description=f"Processing [bold]{app_name}[/bold]")
-                scan, findings, counts = get_all_findings_with_scan(
-                    client, org_id, app_id, version, ratings
-                )
+                    progress.advance(task)
+                    return
+                async with semaphore:
+                    progress.update(
+                        task, description=f"Processing [bold]{app_name}[/bold]"
+                    )
+                    scan, findings, counts = await get_findings(
+                        client, org_id, app_id, version, ratings
+                    )
+                    run_info = {}
+                    if troubleshoot and scan:
+                        run_info = await get_scan_run_async(
+                            client, org_id, scan, app_name
+                        )
 
-                if scan:
-                    app_language = scan.get("language")
+                app_language = scan.get("language") if scan else ""
 
-                source_cohorts, sink_cohorts, source_sink_cohorts, package_cves, reachable_oss_count, unreachable_oss_count, annotated_findings, table_rows = process_findings(app, app_language, scan, findings)
+                source_cohorts, sink_cohorts, source_sink_cohorts, package_cves, reachable_oss_count, unreachable_oss_count, annotated_findings, table_rows = process_findings(app, app_language, scan, findings, render_table)
 
                 annotated_findings = find_best_fix(
-                    org_id, app, scan, findings, counts, source_dir, source_cohorts, sink_cohorts, source_sink_cohorts, package_cves, reachable_oss_count, unreachable_oss_count, annotated_findings, table_rows
+                    org_id, app, scan, findings, counts, source_dir, source_cohorts, sink_cohorts, source_sink_cohorts, package_cves, reachable_oss_count, unreachable_oss_count, annotated_findings, table_rows, render_table
                 )
 
                 oss_findings = get_best_oss_fix(package_cves, reachable_oss_count)
@@ -1886,18 +2094,21 @@ def export_report(
 
                 if troubleshoot:
                     if scan:
-                        ideas, perf_based_reco = get_ideas(client, org_id, app_name, scan, findings, source_dir, annotated_findings, app_language)
+                        ideas, perf_based_reco = get_ideas(run_info, org_id, app_name, scan, findings, source_dir, annotated_findings, app_language)
                         troubleshoot_app(app_name, scan.get('internal_id'), app_language, ideas, perf_based_reco)
                     else:
                         console.print(
                             f"\nNo scan information found for {app_name}. Please review your build pipeline logs for troubleshooting."
                         )
-                if rformat == "csv":
-                    export_csv(annotated_findings, report_file)
-                if rformat == "json":
-                    export_json(app, scan, annotated_findings, oss_findings, counts, report_file, ideas, perf_based_reco)
+                async with report_lock:
+                    if rformat == "csv":
+                        csv_writer = export_csv(csvfile, csv_writer, annotated_findings)
+                    if rformat == "json":
+                        export_json(app, scan, annotated_findings, oss_findings, counts, report_file, ideas, perf_based_reco)
                 progress.advance(task)
 
+            await asyncio.gather(*(process_app(app) for app in app_list))
+
 
 def build_args():
     """
@@ -1949,6 +2160,13 @@ def build_args():
         help="Report for all CVSS 3.1 ratings. Default is critical and high only.",
         default=False,
     )
+    parser.add_argument(
+        "--use-cache",
+        action="store_true",
+        dest="use_cache",
+        help="Reuse findings cached by a previous run if there is no newer scan for the app",
+        default=False,
+    )
     parser.add_argument(
         "--no-logo",
         action="store_true",
@@ -1996,17 +2214,20 @@ if __name__ == "__main__":
             if os.getenv(e):
                 source_dir = os.getenv(e)
                 break
-    export_report(
-        org_id,
-        app_list,
-        report_file,
-        args.rformat,
-        source_dir,
-        args.version,
-        ["critical", "high", "medium", "low"]
-        if args.all_ratings
-        else ["critical", "high"],
-        args.troubleshoot,
+    asyncio.run(
+        export_report(
+            org_id,
+            app_list,
+            report_file,
+            args.rformat,
+            source_dir,
+            args.version,
+            ["critical", "high", "medium", "low"]
+            if args.all_ratings
+            else ["critical", "high"],
+            args.troubleshoot,
+            args.use_cache,
+        )
     )
     end_time = time.monotonic_ns()
     total_time_sec = round((end_time - start_time) / 1000000000, 2)
@@ -165,8 +165,12 @@ def extract_org_id(token):
     return None
 
 
+def get_scan_run_url(org_id, scan, app_name):
+    return f"""https://{config.SHIFTLEFT_API_HOST}/api/v4/private/orgs/{org_id}/apps/{app_name}/scans/{scan.get("id")}/runs?fields=environment,isLibrary,scan_time,scan_duration_ms,sizes,sl,token,upload-request,methods"""
+
+
 def get_scan_run(client, org_id, scan, app_name):
-    scan_run_url = f"""https://{config.SHIFTLEFT_API_HOST}/api/v4/private/orgs/{org_id}/apps/{app_name}/scans/{scan.get("id")}/runs?fields=environment,isLibrary,scan_time,scan_duration_ms,sizes,sl,token,upload-request,methods"""
+    scan_run_url = get_scan_run_url(org_id, scan, app_name)
     try:
         r = client.get(scan_run_url, headers=headers, timeout=config.timeout)
         if r.status_code == 200:
@@ -179,3 +183,20 @@ def get_scan_run(client, org_id, scan, app_name):
             f"Unable to retrieve scan run info for {app_name} due to timeout after {config.timeout} seconds"
         )
     return {}
+
+
+async def get_scan_run_async(client, org_id, scan, app_name):
+    """Same as get_scan_run but using an httpx.AsyncClient"""
+    scan_run_url = get_scan_run_url(org_id, scan, app_name)
+    try:
+        r = await client.get(scan_run_url, headers=headers, timeout=config.timeout)
+        if r.status_code == 200:
+            raw_response = r.json()
+            if raw_response and raw_response.get("response"):
+                response = raw_response.get("response")
+                return response
+    except httpx.ReadTimeout:
+        print(
+            f"Unable to retrieve scan run info for {app_name} due to timeout after {config.timeout} seconds"
+        )
+    return {}
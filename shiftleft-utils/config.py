@@ -35,9 +35,23 @@ sl_owasp_category = {
 # API timeout in seconds
 timeout = 180
 
+# Number of attempts for an API request that times out
+max_retries = 5
+
+# Directory to cache findings between bestfix runs when --use-cache is passed
+cache_dir = os.getenv("SHIFTLEFT_CACHE_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "shiftleft"
+)
+
 # How many chunks of apps to process for stats
 app_chunk_size = 20
 
+# How many apps to fetch findings for concurrently in bestfix
+app_concurrency = 20
+
+# How many pages of findings to fetch concurrently for an app in bestfix
+page_concurrency = 10
+
 ignorable_paths = (
     "test",
     "sample",
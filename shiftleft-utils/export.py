@@ -9,8 +9,6 @@ import time
 import urllib.parse
 
 import httpx
-import joern2sarif.lib.convert as convertLib
-from json2xml import json2xml
 from rich.console import Console
 from rich.progress import Progress
 
@@ -252,6 +250,9 @@ def export_report(org_id, app_list, report_file, reports_dir, format):
                 file_category_set = set()
                 if format == "xml" or report_file.endswith(".xml"):
                     app_report_file = report_file.replace(".xml", "-" + app_id + ".xml")
+                    # Imported here since the xml export is rarely used
+                    from json2xml import json2xml
+
                     with open(app_report_file, mode="w") as rp:
                         xml_data = json2xml.Json2xml(findings).to_xml()
                         if xml_data:
@@ -290,6 +291,8 @@ def export_report(org_id, app_list, report_file, reports_dir, format):
                             indent=None,
                         )
                         rp.flush()
+                    import joern2sarif.lib.convert as convertLib
+
                     convertLib.convert_file(
                         "ng-sast",
                         os.getenv("TOOL_ARGS", ""),
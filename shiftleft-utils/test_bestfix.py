@@ -0,0 +1,220 @@
+import asyncio
+import glob
+import json
+import os
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+import httpx
+from pytest_httpserver import HTTPServer
+from werkzeug.wrappers import Response
+
+import bestfix
+import config
+from bestfix import get_all_findings_cached, get_all_findings_with_scan
+
+FINDINGS_PATH = "/api/v4/orgs/org/apps/app/findings"
+
+
+class PlainHTTPTransport(httpx.AsyncHTTPTransport):
+    """The findings urls are always https, so send them to the test server over http"""
+
+    async def handle_async_request(self, request):
+        request.url = request.url.copy_with(scheme="http")
+        return await super().handle_async_request(request)
+
+
+def serve_findings(
+    httpserver,
+    pages,
+    next_page_query="per_page=2&page={page}",
+    total_count=True,
+    failed_pages=(),
+    slow_pages=(),
+    scan_id="scan-1",
+    failed_counts=False,
+):
+    """Serve the given pages of findings. Pages are numbered from 1 and are
+    identified by either the page or the cursor query parameter
+    """
+
+    def handler(request):
+        if request.args.get("only_counts") == "true":
+            if failed_counts:
+                return Response(status=500)
+            raw_response = {"ok": True, "response": {"scan": {"id": scan_id}}}
+            return Response(json.dumps(raw_response), content_type="application/json")
+        page = int(request.args.get("page") or request.args.get("cursor") or 1)
+        if page in failed_pages:
+            return Response(status=500)
+        if page in slow_pages:
+            time.sleep(0.5)
+        response = {
+            "scan": {"id": scan_id},
+            "counts": [],
+            "findings": pages[page - 1],
+        }
+        if total_count:
+            response["total_count"] = sum(len(p) for p in pages)
+        raw_response = {"ok": True, "response": response}
+        if page < len(pages):
+            query = next_page_query.format(page=page + 1)
+            raw_response["next_page"] = (
+                f"https://app.shiftleft.io{FINDINGS_PATH}?{query}"
+            )
+        return Response(json.dumps(raw_response), content_type="application/json")
+
+    httpserver.expect_request(FINDINGS_PATH).respond_with_handler(handler)
+
+
+def run_with_server(httpserver, get_findings):
+    async def run():
+        async with httpx.AsyncClient(transport=PlainHTTPTransport()) as client:
+            return await get_findings(client, "org", "app", None, [])
+
+    with patch.object(
+        config, "SHIFTLEFT_API_HOST", f"{httpserver.host}:{httpserver.port}"
+    ):
+        return asyncio.run(run())
+
+
+def cache_files(cache_dir):
+    return glob.glob(os.path.join(cache_dir, "org", "app-*.json"))
+
+
+def requested_pages(httpserver):
+    return [req.args.get("page") for req, _ in httpserver.log]
+
+
+def finding_ids(findings):
+    return [f.get("id") for f in findings]
+
+
+PAGES = [[{"id": "1"}, {"id": "2"}], [{"id": "3"}, {"id": "4"}], [{"id": "5"}]]
+
+
+class TestGetAllFindingsWithScan(TestCase):
+    def test_next_page_without_page_parameter(self):
+        with HTTPServer() as httpserver:
+            serve_findings(
+                httpserver, PAGES, next_page_query="per_page=2&cursor={page}"
+            )
+            scan, findings, _ = run_with_server(httpserver, get_all_findings_with_scan)
+            httpserver.check_handler_errors()
+        self.assertEqual(scan.get("id"), "scan-1")
+        self.assertEqual(finding_ids(findings), ["1", "2", "3", "4", "5"])
+        self.assertEqual(len(httpserver.log), 3)
+
+    def test_missing_total_count(self):
+        with HTTPServer() as httpserver:
+            serve_findings(httpserver, PAGES, total_count=False)
+            _, findings, _ = run_with_server(httpserver, get_all_findings_with_scan)
+            httpserver.check_handler_errors()
+        self.assertEqual(finding_ids(findings), ["1", "2", "3", "4", "5"])
+        self.assertEqual(requested_pages(httpserver), [None, "2", "3"])
+
+    def test_per_page_is_unchanged(self):
+        with HTTPServer() as httpserver:
+            serve_findings(httpserver, PAGES)
+            run_with_server(httpserver, get_all_findings_with_scan)
+            httpserver.check_handler_errors()
+        page_requests = [req for req, _ in httpserver.log if req.args.get("page")]
+        self.assertEqual(
+            sorted(req.args.get("page") for req in page_requests), ["2", "3"]
+        )
+        for req in page_requests:
+            self.assertEqual(req.args.get("per_page"), "2")
+
+    def test_findings_are_in_page_order(self):
+        pages = [[{"id": str(p)}] for p in range(1, 6)]
+        with HTTPServer(threaded=True) as httpserver:
+            serve_findings(
+                httpserver,
+                pages,
+                next_page_query="per_page=1&page={page}",
+                slow_pages=(2,),
+            )
+            _, findings, _ = run_with_server(httpserver, get_all_findings_with_scan)
+            httpserver.check_handler_errors()
+        # The slow page is answered last but its findings must stay in place
+        self.assertEqual(requested_pages(httpserver)[-1], "2")
+        self.assertEqual(finding_ids(findings), ["1", "2", "3", "4", "5"])
+
+    def test_failed_middle_page_is_logged(self):
+        pages = [[{"id": str(p)}] for p in range(1, 5)]
+        with HTTPServer() as httpserver:
+            serve_findings(
+                httpserver,
+                pages,
+                next_page_query="per_page=1&page={page}",
+                failed_pages=(3,),
+            )
+            with patch.object(bestfix.console, "print") as console_print:
+                _, findings, _ = run_with_server(httpserver, get_all_findings_with_scan)
+            httpserver.check_handler_errors()
+        self.assertEqual(finding_ids(findings), ["1", "2", "4"])
+        messages = [str(c.args[0]) for c in console_print.call_args_list]
+        self.assertTrue(any("page=3" in m and "missing" in m for m in messages))
+
+
+class TestGetAllFindingsCached(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        patcher = patch.object(config, "cache_dir", self.cache_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.cache_dir.cleanup)
+
+    def test_same_scan_is_served_from_cache(self):
+        with HTTPServer() as httpserver:
+            serve_findings(httpserver, PAGES)
+            run_with_server(httpserver, get_all_findings_cached)
+            httpserver.clear()
+            serve_findings(httpserver, PAGES)
+            scan, findings, _ = run_with_server(httpserver, get_all_findings_cached)
+            httpserver.check_handler_errors()
+        self.assertEqual(scan.get("id"), "scan-1")
+        self.assertEqual(finding_ids(findings), ["1", "2", "3", "4", "5"])
+        # Only the counts query is made
+        self.assertEqual(len(httpserver.log), 1)
+
+    def test_new_scan_is_refetched(self):
+        new_pages = [[{"id": "6"}]]
+        with HTTPServer() as httpserver:
+            serve_findings(httpserver, PAGES)
+            run_with_server(httpserver, get_all_findings_cached)
+            httpserver.clear()
+            serve_findings(httpserver, new_pages, scan_id="scan-2")
+            scan, findings, _ = run_with_server(httpserver, get_all_findings_cached)
+            httpserver.check_handler_errors()
+        self.assertEqual(scan.get("id"), "scan-2")
+        self.assertEqual(finding_ids(findings), ["6"])
+        files = cache_files(self.cache_dir.name)
+        self.assertEqual(len(files), 1)
+        with open(files[0]) as fp:
+            cached = json.load(fp)
+        self.assertEqual(cached.get("scan_id"), "scan-2")
+        self.assertEqual(finding_ids(cached.get("findings")), ["6"])
+
+    def test_corrupt_cache_is_refetched(self):
+        with HTTPServer() as httpserver:
+            serve_findings(httpserver, PAGES)
+            run_with_server(httpserver, get_all_findings_cached)
+            for cache_file in cache_files(self.cache_dir.name):
+                with open(cache_file, "w") as fp:
+                    fp.write('{"scan_id": "scan-1", "findi')
+            _, findings, _ = run_with_server(httpserver, get_all_findings_cached)
+            httpserver.check_handler_errors()
+        self.assertEqual(finding_ids(findings), ["1", "2", "3", "4", "5"])
+        with open(cache_files(self.cache_dir.name)[0]) as fp:
+            self.assertEqual(json.load(fp).get("scan_id"), "scan-1")
+
+    def test_failed_counts_query_is_not_cached(self):
+        with HTTPServer() as httpserver:
+            serve_findings(httpserver, PAGES, failed_counts=True)
+            _, findings, _ = run_with_server(httpserver, get_all_findings_cached)
+            httpserver.check_handler_errors()
+        self.assertEqual(finding_ids(findings), ["1", "2", "3", "4", "5"])
+        self.assertEqual(cache_files(self.cache_dir.name), [])